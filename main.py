@@ -1,14 +1,64 @@
 # main.py
+import logging
+import os
+import queue
+import re
+import sys
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
+
 import uvicorn
-from fastapi import FastAPI
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import BackgroundTasks, FastAPI, Request, Response
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
+from typing import Optional
+
+from pydantic import TypeAdapter
+
+# ─── Logging: records are queued and written to stderr by a background thread ───
+# Configured before the services are imported → their import-time warnings use it too
+_log_queue: queue.Queue = queue.Queue(-1)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_handler)
+
+_logger = logging.getLogger("trendspark")
+_logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+_logger.addHandler(QueueHandler(_log_queue))
+_logger.propagate = False
+_log_listener.start()
 
 # Import your models and services
 from models import IdeaInput, ValidationReport
+from services.ai_service import init_models
 from services.pipeline_service import run_validation_pipeline
+from services.search_service import close_client
+from services.storage_service import persist_report
+
+# static/index.html (None if missing), resolved once at startup
+_INDEX_PATH: Optional[Path] = None
+
+
+def load_frontend() -> None:
+    global _INDEX_PATH
+    index_path = Path("static") / "index.html"
+    if index_path.is_file():
+        _INDEX_PATH = index_path
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: build the Gemini model handles and resolve the frontend once per worker,
+    # before the first request arrives
+    init_models()
+    load_frontend()
+    yield
+    # Shutdown: release pooled search connections, then flush queued log records
+    await close_client()
+    _log_listener.stop()
+
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -17,9 +67,12 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
+
 # ─── Enable CORS (fixes OPTIONS 405 errors from browser preflight) ───
 app.add_middleware(
     CORSMiddleware,
@@ -33,17 +86,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["Content-Type", "Accept"],
+    max_age=86400,                  # let browsers cache preflight results for 24h
 )
 
+# Content-hashed asset names (e.g. app.3f9a1c2b.js) never change → cache them forever
+_HASHED_ASSET_RE = re.compile(r"\.[0-9a-f]{8,}\.\w+$")
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that marks content-hashed assets as immutable."""
+
+    def file_response(self, full_path, *args, **kwargs):
+        response = super().file_response(full_path, *args, **kwargs)
+        if _HASHED_ASSET_RE.search(str(full_path)):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
 # Mount the static folder → /static/index.html
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 # Serve frontend at root path (/)
 @app.get("/", include_in_schema=False)
-async def serve_frontend():
-    index_path = Path("static") / "index.html"
-    
-    if not index_path.is_file():
+async def serve_frontend(request: Request):
+    # Stat on every request → Content-Length and the ETag follow edits made while running
+    try:
+        index_stat = _INDEX_PATH.stat() if _INDEX_PATH is not None else None
+    except OSError:
+        index_stat = None
+
+    if index_stat is None:
         return HTMLResponse(
             content="""
             <h1 style="color: #ff4444; text-align: center; margin-top: 120px; font-family: system-ui;">
@@ -57,14 +129,21 @@ async def serve_frontend():
             status_code=404
         )
     
+    # Revalidate with the ETag (mtime + size) → repeat visits get a body-less 304
+    etag = f'"{index_stat.st_mtime_ns:x}-{index_stat.st_size:x}"'
+    cache_headers = {
+        "Cache-Control": "public, max-age=60, must-revalidate",
+        "ETag": etag,
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=cache_headers)
+
     return FileResponse(
-        path=index_path,
+        path=_INDEX_PATH,
         media_type="text/html",
-        headers={
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Pragma": "no-cache",
-            "Expires": "0"
-        }
+        headers=cache_headers,
+        stat_result=index_stat,         # already taken above → FileResponse doesn't stat again
     )
 
 # Health check
@@ -74,23 +153,51 @@ async def get_health():
     return {"status": "ok"}
 
 
+# Bare OPTIONS probes on the validate endpoint → answer immediately
+# (real CORS preflights are already answered by CORSMiddleware)
+@app.options("/api/v1/validate", include_in_schema=False)
+async def validate_options():
+    return Response(
+        status_code=204,
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "POST",
+            "Access-Control-Max-Age": "86400",
+        }
+    )
+
+
+# Built once → reports are encoded straight to JSON bytes by pydantic-core
+_REPORT_ADAPTER = TypeAdapter(ValidationReport)
+
+
 # Main validation endpoint
 @app.post("/api/v1/validate", response_model=ValidationReport)
-async def validate_idea(idea: IdeaInput):
+async def validate_idea(idea: IdeaInput, bg: BackgroundTasks):
     """
     Receives an IdeaInput object and returns a full ValidationReport.
+    The report is saved to disk after the response has been sent.
     """
-    report = run_validation_pipeline(idea)
-    return report
+    report = await run_validation_pipeline(idea)
+    bg.add_task(persist_report, report)
+    return Response(
+        content=_REPORT_ADAPTER.dump_json(report),
+        media_type="application/json"
+    )
 
 
 # Run the server
 if __name__ == "__main__":
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    reload = os.getenv("DEV_RELOAD", "0") == "1"   # auto-reload on file changes (dev only)
+
     uvicorn.run(
         "main:app",
         host="127.0.0.1",
         port=8000,
-        reload=True,                # auto-reload on file changes (great for dev)
-        reload_dirs=["."],          # watch current directory (Backend)
-        # workers=1,                # uncomment only when you need multiple workers
-    )
\ No newline at end of file
+        workers=workers,            # ignored by uvicorn when reload is on
+        reload=reload,
+        reload_dirs=["."] if reload else None,      # watch current directory (Backend)
+        loop="asyncio" if sys.platform == "win32" else "uvloop",   # uvloop has no Windows build
+        http="httptools",
+    )
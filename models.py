@@ -1,5 +1,5 @@
 # models.py
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 
 
@@ -28,10 +28,10 @@ class IdeaInput(BaseModel):
         examples=["College students aged 18-24", "Busy working professionals", "Eco-conscious Gen Z"]
     )
 
-    class Config:
+    model_config = ConfigDict(
         # Allow population by field name or alias (future-proof)
-        populate_by_name = True
-        json_schema_extra = {
+        populate_by_name=True,
+        json_schema_extra={
             "example": {
                 "title": "StudySync - AI Study Planner",
                 "description": "Personalized study schedules and flashcards using AI for university students.",
@@ -39,6 +39,7 @@ class IdeaInput(BaseModel):
                 "target_audience": "University students"
             }
         }
+    )
 
 
 # ─── COMPONENT MODELS ───
@@ -93,8 +94,8 @@ class ValidationReport(BaseModel):
         description="3 practical next actions for the founder"
     )
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "report_id": "550e8400-e29b-41d4-a716-446655440000",
                 "idea_name": "StudySync - AI Study Planner",
@@ -125,4 +126,5 @@ class ValidationReport(BaseModel):
                     "Compare freemium vs one-time purchase models"
                 ]
             }
-        }
\ No newline at end of file
+        }
+    )
@@ -1,14 +1,20 @@
 # services/ai_service.py
+import logging
 import os
-import json
 import re
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, List, Optional, Tuple
 
+import orjson
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential
 
 from models import IdeaInput, SWOT, MarketAnalysis
 
+logger = logging.getLogger("trendspark")
+
 # ─── Load environment variables ───
 load_dotenv()
 
@@ -21,6 +27,13 @@ if not API_KEY:
 
 genai.configure(api_key=API_KEY)
 
+# Patterns used by safe_json_parse (compiled once)
+_FENCE_RE = re.compile(
+    r'^(?:\s*```(?:json)?\s*|\s*```)\s*|\s*(?:```(?:json)?\s*|\s*```)\s*$',
+    re.MULTILINE | re.IGNORECASE
+)
+_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+
 # Ordered list of models to try (best first)
 MODEL_CANDIDATES = [
     "gemini-2.5-flash",               # your preferred / latest
@@ -33,60 +46,143 @@ MODEL_CANDIDATES = [
     "gemini-flash-latest",
 ]
 
-# Global model cache – we initialize lazily and switch on failure
-_current_model = None
-_current_model_name = None
+# Per-call timeout (seconds) → a hung connection can't hold a worker slot forever
+REQUEST_TIMEOUT = 20
+
+# Transient errors → back off, then retry on the same model
+_RETRYABLE_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable)
+
+# 2.5-series models think before answering, and thinking tokens count against
+# max_output_tokens → give them this much headroom on top of the answer budget
+# (kept small so the JSON calls stay under the 2048-token model default)
+_THINKING_MODELS = {"gemini-2.5-flash", "gemini-2.5-pro", "gemini-flash-latest"}
+THINKING_TOKEN_ALLOWANCE = 1024
 
+# Total Gemini calls per generate() → bounds the cost of an outage for one request
+MAX_ATTEMPTS = 3
 
-def get_model():
-    """Get or initialize a working Gemini model with automatic fallback"""
-    global _current_model, _current_model_name
+# Models that recently hit quota / availability errors are skipped until this many
+# seconds have passed, after which the preferred model is tried again
+MODEL_COOLDOWN = 60
 
-    if _current_model is not None:
-        return _current_model
+# Model handles by name – built once at app startup (see main.py)
+_MODELS: Dict[str, "genai.GenerativeModel"] = {}
+_cooldown_until: Dict[str, float] = {}
 
+
+def init_models() -> None:
+    """Build a GenerativeModel for every candidate (no network calls)"""
     for model_name in MODEL_CANDIDATES:
-        try:
-            print(f"Trying to initialize model: {model_name}")
-            model = genai.GenerativeModel(
-                model_name=model_name,
-                generation_config={
-                    "temperature": 0.3,
-                    "top_p": 0.95,
-                    "top_k": 40,
-                    "max_output_tokens": 2048,
-                },
-                safety_settings={
-                    "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE",
-                    "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE",
-                    "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE",
-                    "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
-                }
-            )
-            # Quick test call to verify the model is usable
-            test_response = model.generate_content("Say hello")
-            if test_response.text:
-                print(f"Successfully initialized model: {model_name}")
-                _current_model = model
-                _current_model_name = model_name
-                return model
-
-        except Exception as e:
-            err_str = str(e).lower()
-            print(f"Model {model_name} failed: {err_str[:120]}...")
-            if any(x in err_str for x in ["429", "quota", "rate limit", "resourceexhausted", "503", "unavailable"]):
-                print(f"→ Rate limit / quota hit on {model_name}. Trying next model...")
-                continue
-            elif "not found" in err_str or "unsupported" in err_str:
-                print(f"→ Model {model_name} not available in this project/region. Skipping.")
-                continue
-            else:
-                print(f"→ Unexpected error with {model_name}. Skipping.")
-
-    raise RuntimeError(
-        "No usable Gemini model could be initialized. "
-        "Check your API key, quota, and region restrictions."
+        get_model(model_name)
+
+
+def get_model(model_name: str):
+    """Return the model handle for model_name, building it on first use"""
+    model = _MODELS.get(model_name)
+    if model is None:
+        logger.info("Initializing model: %s", model_name)
+        model = _MODELS[model_name] = genai.GenerativeModel(
+            model_name=model_name,
+            generation_config={
+                "temperature": 0.3,
+                "top_p": 0.95,
+                "top_k": 40,
+                "max_output_tokens": 2048,
+            },
+            safety_settings={
+                "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE",
+                "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE",
+                "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE",
+                "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
+            }
+        )
+    return model
+
+
+def _available_models() -> List[str]:
+    """Candidates in preference order, minus those still cooling down after a failure"""
+    now = time.monotonic()
+    return [name for name in MODEL_CANDIDATES if _cooldown_until.get(name, 0.0) <= now]
+
+
+def _is_transient_error(e: BaseException) -> bool:
+    """Quota / availability errors → worth backing off and trying the same model again"""
+    if isinstance(e, _RETRYABLE_ERRORS):
+        return True
+    err_str = str(e).lower()
+    return any(x in err_str for x in ["429", "quota", "rate limit", "resourceexhausted", "503", "unavailable"])
+
+
+def _is_model_error(e: BaseException) -> bool:
+    """Transient errors, or a model that doesn't exist / isn't supported here → worth retrying"""
+    if _is_transient_error(e):
+        return True
+    err_str = str(e).lower()
+    return "not found" in err_str or "unsupported" in err_str
+
+
+def _generation_config_for(model_name: str, generation_config: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Per-call generation config, with the output limit raised for thinking models"""
+    if model_name not in _THINKING_MODELS or not generation_config or "max_output_tokens" not in generation_config:
+        return generation_config
+    return {
+        **generation_config,
+        "max_output_tokens": generation_config["max_output_tokens"] + THINKING_TOKEN_ALLOWANCE,
+    }
+
+
+async def _stream_text(model, prompt: str, **kwargs) -> str:
+    """Stream a single generation and join the text chunks"""
+    response = await model.generate_content_async(
+        prompt,
+        stream=True,
+        request_options={"timeout": REQUEST_TIMEOUT},
+        **kwargs
     )
+    chunks = []
+    async for chunk in response:
+        if chunk.parts:
+            chunks.append(chunk.text)
+    return "".join(chunks)
+
+
+async def generate(prompt: str, generation_config: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+    """
+    Run a prompt and return the generated text.
+    The response is streamed, so chunks are collected while generation continues.
+    The call starts on the most preferred model that isn't cooling down. Quota /
+    availability errors are retried on that model after an exponential backoff;
+    a model that is missing / unsupported, or still failing once the MAX_ATTEMPTS
+    budget is spent, is put on cooldown and later attempts / calls use the next one.
+    max_output_tokens in generation_config is the answer budget; thinking models get extra room.
+    """
+    model_name: Optional[str] = None
+    async for attempt in AsyncRetrying(
+        stop=stop_after_attempt(MAX_ATTEMPTS),
+        wait=wait_exponential(multiplier=0.3, max=3),
+        retry=retry_if_exception(_is_model_error),
+        reraise=True,
+    ):
+        with attempt:
+            if model_name is None:
+                # Everything cooling down → still try the preferred model rather than fail outright
+                model_name = (_available_models() or MODEL_CANDIDATES)[0]
+            try:
+                return await _stream_text(
+                    get_model(model_name),
+                    prompt,
+                    generation_config=_generation_config_for(model_name, generation_config),
+                    **kwargs
+                )
+            except Exception as e:
+                logger.warning("Model %s failed: %.120s...", model_name, e)
+                if _is_transient_error(e) and attempt.retry_state.attempt_number < MAX_ATTEMPTS:
+                    logger.warning("→ %s busy. Retrying after backoff...", model_name)
+                elif _is_model_error(e):
+                    logger.warning("→ %s unavailable for %ds. Trying next model...", model_name, MODEL_COOLDOWN)
+                    _cooldown_until[model_name] = time.monotonic() + MODEL_COOLDOWN
+                    model_name = None
+                raise
 
 
 def safe_json_parse(text: str) -> Optional[Dict[str, Any]]:
@@ -95,41 +191,50 @@ def safe_json_parse(text: str) -> Optional[Dict[str, Any]]:
     Handles code blocks, markdown, extra whitespace, etc.
     """
     if not text or not isinstance(text, str):
-        print("safe_json_parse: received empty or invalid input")
+        logger.warning("safe_json_parse: received empty or invalid input")
         return None
 
+    # JSON-mode responses are already raw JSON → skip the regex cleanup
+    if text.lstrip().startswith("{"):
+        try:
+            parsed = orjson.loads(text)
+            if isinstance(parsed, dict):
+                return parsed
+        except orjson.JSONDecodeError:
+            pass
+
     # Remove common markdown/code fences
-    cleaned = re.sub(
-        r'^(?:\s*```(?:json)?\s*|\s*```)\s*|\s*(?:```(?:json)?\s*|\s*```)\s*$',
-        '',
-        text.strip(),
-        flags=re.MULTILINE | re.IGNORECASE
-    )
+    cleaned = _FENCE_RE.sub('', text.strip())
 
     # Extract the first JSON object-like structure
-    match = re.search(r'\{.*\}', cleaned, re.DOTALL)
+    match = _JSON_RE.search(cleaned)
     if match:
         cleaned = match.group(0)
 
     try:
-        parsed = json.loads(cleaned)
+        parsed = orjson.loads(cleaned)
         if isinstance(parsed, dict):
             return parsed
         else:
-            print(f"Parsed result is not a dict: {type(parsed)}")
+            logger.warning("Parsed result is not a dict: %s", type(parsed))
             return None
-    except json.JSONDecodeError as e:
-        print(f"JSON decode failed:\nFirst 300 chars: {text[:300]}...\nError: {e}")
+    except orjson.JSONDecodeError as e:
+        logger.warning("JSON decode failed: %s", e)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("First 300 chars: %s...", text[:300])
         return None
     except Exception as e:
-        print(f"Unexpected error in safe_json_parse: {e}")
+        logger.exception("Unexpected error in safe_json_parse: %s", e)
         return None
 
 
-def get_swot_analysis(idea: IdeaInput) -> SWOT:
-    """Generate SWOT analysis using Gemini with fallback"""
+async def get_swot_and_market_analysis(idea: IdeaInput) -> Tuple[SWOT, MarketAnalysis, bool]:
+    """
+    Generate SWOT analysis, audience profile and search keywords in one Gemini call.
+    The flag is False when either half fell back to placeholder data.
+    """
     prompt = f"""\
-You are an experienced startup advisor.
+You are an experienced startup advisor and market research expert.
 Analyze this startup idea:
 
 Title: {idea.title}
@@ -137,86 +242,75 @@ Description: {idea.description}
 Industry: {idea.industry or "Not specified"}
 Target audience: {idea.target_audience or "Not specified"}
 
-Create a realistic SWOT analysis.
+1. Create a realistic SWOT analysis.
+2. Write a concise "audience_profile" (2–4 sentences) describing the typical user.
+3. Provide 6–12 realistic "potential_keywords" people might search on Google.
+
 Return **only** valid JSON with these exact keys:
 {{
-  "strengths": list of strings,
-  "weaknesses": list of strings,
-  "opportunities": list of strings,
-  "threats": list of strings
+  "swot": {{
+    "strengths": list of strings,
+    "weaknesses": list of strings,
+    "opportunities": list of strings,
+    "threats": list of strings
+  }},
+  "market": {{
+    "audience_profile": string,
+    "potential_keywords": list of strings
+  }}
 }}
 No explanations, no markdown, no extra text.
 """
 
     try:
-        model = get_model()
-        response = model.generate_content(prompt)
-        data = safe_json_parse(response.text)
-
-        if data and isinstance(data, dict):
-            return SWOT(**data)
-
-        print("SWOT: Invalid or empty JSON from model")
-        return SWOT(
-            strengths=["Could not generate SWOT analysis"],
-            weaknesses=["AI response was malformed"],
-            opportunities=[],
-            threats=[]
-        )
-
-    except Exception as e:
-        print(f"SWOT analysis failed: {str(e)[:200]}...")
-        return SWOT(
-            strengths=["Service temporarily unavailable"],
-            weaknesses=[str(e)],
-            opportunities=[],
-            threats=[]
+        text = await generate(
+            prompt,
+            generation_config={
+                "temperature": 0.2,
+                "max_output_tokens": 896,           # ~512 for SWOT + ~384 for market
+                "response_mime_type": "application/json",
+            }
         )
+        data = safe_json_parse(text) or {}
 
+        swot_data = data.get("swot")
+        market_data = data.get("market")
+        complete = isinstance(swot_data, dict) and isinstance(market_data, dict)
 
-def get_market_analysis(idea: IdeaInput) -> MarketAnalysis:
-    """Generate target audience profile and search keywords"""
-    prompt = f"""\
-You are a market research expert.
-For this startup idea:
-
-Title: {idea.title}
-Description: {idea.description}
-Industry: {idea.industry or "Not specified"}
-Target audience: {idea.target_audience or "Not specified"}
-
-1. Write a concise "audience_profile" (2–4 sentences) describing the typical user.
-2. Provide 6–12 realistic "potential_keywords" people might search on Google.
-
-Return **only** valid JSON:
-{{
-  "audience_profile": string,
-  "potential_keywords": list of strings
-}}
-Nothing else.
-"""
-
-    try:
-        model = get_model()
-        response = model.generate_content(
-            prompt,
-            generation_config={"temperature": 0.1}
-        )
-        
-        data = safe_json_parse(response.text)
+        if isinstance(swot_data, dict):
+            swot = SWOT(**swot_data)
+        else:
+            logger.warning("SWOT: Invalid or empty JSON from model")
+            swot = SWOT(
+                strengths=["Could not generate SWOT analysis"],
+                weaknesses=["AI response was malformed"],
+                opportunities=[],
+                threats=[]
+            )
 
-        if data and isinstance(data, dict):
-            return MarketAnalysis(**data)
+        if isinstance(market_data, dict):
+            market = MarketAnalysis(**market_data)
+        else:
+            logger.warning("Market analysis: Invalid JSON received")
+            market = MarketAnalysis(
+                audience_profile="Could not generate profile due to formatting issue",
+                potential_keywords=[]
+            )
 
-        print("Market analysis: Invalid JSON received")
-        return MarketAnalysis(
-            audience_profile="Could not generate profile due to formatting issue",
-            potential_keywords=[]
-        )
+        return swot, market, complete
 
     except Exception as e:
-        print(f"Market analysis failed: {str(e)[:200]}...")
-        return MarketAnalysis(
-            audience_profile=f"Service error: {str(e)}",
-            potential_keywords=[]
-        )
\ No newline at end of file
+        logger.error("SWOT / market analysis failed: %.200s...", e)
+        return (
+            SWOT(
+                strengths=["Service temporarily unavailable"],
+                weaknesses=[str(e)],
+                opportunities=[],
+                threats=[]
+            ),
+            MarketAnalysis(
+                audience_profile=f"Service error: {str(e)}",
+                potential_keywords=[]
+            ),
+            False,
+        )
@@ -1,33 +1,96 @@
 # services/pipeline_service.py
+import asyncio
+import hashlib
+import logging
 import uuid
-from typing import List
+from typing import Dict, List, Tuple
 
-from models import IdeaInput, ValidationReport, SWOT, MarketAnalysis, Competitor
-from services.ai_service import get_swot_analysis, get_market_analysis, safe_json_parse, get_model
+import orjson
+from cachetools import TTLCache
+
+from models import IdeaInput, ValidationReport, Competitor
+from services.ai_service import get_swot_and_market_analysis, safe_json_parse, generate
 from services.search_service import get_competitor_search
 
 
-def run_validation_pipeline(idea: IdeaInput) -> ValidationReport:
+logger = logging.getLogger("trendspark")
+
+# Finished reports per idea → repeat submissions skip the Gemini + search calls
+_REPORT_CACHE: TTLCache = TTLCache(maxsize=512, ttl=3600)
+
+# Pipelines currently running per idea → concurrent duplicates share one upstream chain
+_IN_FLIGHT: Dict[str, "asyncio.Task[ValidationReport]"] = {}
+
+
+def idea_cache_key(idea: IdeaInput) -> str:
+    """Stable hash of the idea fields (title, description, industry, target audience)"""
+    return hashlib.blake2b(orjson.dumps(idea.model_dump()), digest_size=16).hexdigest()
+
+
+async def run_validation_pipeline(idea: IdeaInput) -> ValidationReport:
     """
     Runs the full validation pipeline for a startup idea.
+    Identical ideas reuse a cached report, or join the run already in progress
+    (with a new report_id either way).
     Returns a complete ValidationReport.
     """
+    key = idea_cache_key(idea)
+
+    report = _REPORT_CACHE.get(key)
+    if report is not None:
+        logger.info("Returning cached report for: '%s'", report.idea_name)
+        return report.model_copy(update={"report_id": str(uuid.uuid4())})
+
+    task = _IN_FLIGHT.get(key)
+    if task is None:
+        task = asyncio.create_task(_run_and_cache(key, idea))
+        _IN_FLIGHT[key] = task
+        task.add_done_callback(lambda _: _IN_FLIGHT.pop(key, None))
+        # shield → a disconnecting client doesn't cancel the run for everyone else
+        return await asyncio.shield(task)
+
+    logger.info("Joining in-flight validation for: '%s'", idea.title)
+    report = await asyncio.shield(task)
+    return report.model_copy(update={"report_id": str(uuid.uuid4())})
+
+
+async def _run_and_cache(key: str, idea: IdeaInput) -> ValidationReport:
+    report, complete = await _run_pipeline(idea)
+    # Don't keep error placeholders around for an hour
+    if complete:
+        _REPORT_CACHE[key] = report
+    return report
+
+
+async def _run_pipeline(idea: IdeaInput) -> Tuple[ValidationReport, bool]:
+    """
+    Runs every pipeline step. The flag is False when any Gemini step fell back to
+    defaults, or when there were keywords but the competitor search came back empty.
+    """
     # Safe title fallback
     idea_title = idea.title.strip() if idea.title else "Untitled Idea"
     idea_industry = idea.industry or "not specified"
 
-    print(f"Starting validation pipeline for: '{idea_title}' (industry: {idea_industry})")
+    logger.info("Starting validation pipeline for: '%s' (industry: %s)", idea_title, idea_industry)
 
-    # Step 1 & 2: Core analyses
-    swot_data: SWOT = get_swot_analysis(idea)
-    market_data: MarketAnalysis = get_market_analysis(idea)
+    # Step 1 & 2: Core analyses (single batched Gemini call)
+    swot_data, market_data, analysis_complete = await get_swot_and_market_analysis(idea)
 
     # Step 3: Competitor search based on market keywords
-    competitor_data: List[Competitor] = get_competitor_search(
+    competitor_data: List[Competitor] = await get_competitor_search(
         market_data.potential_keywords
     )
 
     # Step 4: Final AI summary + scoring
+    analysis_context = orjson.dumps(
+        {
+            "swot": swot_data.model_dump(),
+            "market": market_data.model_dump(),
+            "competitors": [c.model_dump() for c in competitor_data],
+        },
+        option=orjson.OPT_INDENT_2
+    ).decode()
+
     summary_prompt = f"""
 You are an experienced startup investor and product strategist.
 
@@ -38,14 +101,8 @@ Description: {idea.description or "No description provided"}
 Industry/Category: {idea_industry}
 Target Audience: {idea.target_audience or "Not specified"}
 
-SWOT Analysis:
-{swot_data.model_dump_json(indent=2)}
-
-Market Analysis:
-{market_data.model_dump_json(indent=2)}
-
-Competitors Found:
-{[c.model_dump_json(indent=2) for c in competitor_data]}
+SWOT analysis, market analysis and competitors found:
+{analysis_context}
 
 Based on ALL this information, produce a concise, honest evaluation in valid JSON format ONLY.
 Required keys:
@@ -56,17 +113,24 @@ Required keys:
 Return ONLY the JSON object. No extra text, no markdown, no explanations.
 """
 
+    # Empty usually means the search failed (same rule as search_service's own cache)
+    complete = analysis_complete and (bool(competitor_data) or not market_data.potential_keywords)
     try:
-        # ─── FIXED: Call the function to get the actual model ───
-        model = get_model()
-        response = model.generate_content(summary_prompt)
-        final_data = safe_json_parse(response.text)
+        text = await generate(
+            summary_prompt,
+            generation_config={
+                "max_output_tokens": 600,
+                "response_mime_type": "application/json",
+            }
+        )
+        final_data = safe_json_parse(text)
 
         if not isinstance(final_data, dict):
             raise ValueError("AI response was not parsed into a dictionary")
 
     except Exception as e:
-        print(f"Error in final summary generation: {str(e)[:300]}...")
+        complete = False
+        logger.error("Error in final summary generation: %.300s...", e)
         final_data = {
             "executive_summary": "Unable to generate final summary due to an error.",
             "overall_score": 1.0,
@@ -92,4 +156,4 @@ Return ONLY the JSON object. No extra text, no markdown, no explanations.
         recommended_next_steps=final_data.get("recommended_next_steps", [])
     )
 
-    return report
\ No newline at end of file
+    return report, complete
\ No newline at end of file
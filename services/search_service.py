@@ -1,11 +1,22 @@
 # services/search_service.py
+import asyncio
+import logging
 import os
-import requests
+import pickle
+import re
+import sqlite3
+import threading
+import httpx
+import orjson
+import zstandard
 from typing import List, Optional
+from diskcache import Cache
 from dotenv import load_dotenv
 
 from models import Competitor
 
+logger = logging.getLogger("trendspark")
+
 # ─── Load environment variables ───
 load_dotenv()
 
@@ -15,92 +26,301 @@ SEARCH_URL = "https://www.googleapis.com/customsearch/v1"
 
 # Basic validation at module level (runs once on import)
 if not SEARCH_API_KEY or not SEARCH_CX:
-    print("WARNING: Google Custom Search API credentials missing!")
-    print("  → Set GOOGLE_SEARCH_API_KEY and GOOGLE_SEARCH_CX in .env file")
-    print("  → Get them at: https://developers.google.com/custom-search/v1/overview")
+    logger.warning(
+        "Google Custom Search API credentials missing! "
+        "Set GOOGLE_SEARCH_API_KEY and GOOGLE_SEARCH_CX in .env file "
+        "(get them at: https://developers.google.com/custom-search/v1/overview)"
+    )
 
+# Static query params → each call only adds "q" and "num"
+_BASE_PARAMS = {"key": SEARCH_API_KEY, "cx": SEARCH_CX}
 
-def get_competitor_search(keywords: List[str], max_results: int = 6) -> List[Competitor]:
-    """
-    Search for potential competitors using Google Custom Search JSON API.
-    
-    Args:
-        keywords: List of potential search keywords from market analysis
-        max_results: Max number of results to return (default 6)
-    
-    Returns:
-        List of Competitor objects (name, url, snippet)
-    """
-    if not keywords or not SEARCH_API_KEY or not SEARCH_CX:
-        print("Skipping competitor search: no keywords or missing API credentials")
-        return []
+# Collapses runs of whitespace/newlines in result snippets
+_WS_RE = re.compile(r"\s+")
 
-    # Use top 3–5 keywords → better relevance than just first one
-    top_keywords = keywords[:5]
-    query = " OR ".join(f'"{k}"' for k in top_keywords if k.strip())
+_HEADERS = {
+    "User-Agent": "TrendSpark/1.0 (College Project; +https://github.com/your-repo)"
+}
+
+# Recent results per (keyword, max_results) → repeat searches don't spend Google API quota.
+# Stored on disk, so entries survive restarts / reloads and are shared between workers.
+SEARCH_CACHE_DIR = os.getenv("SEARCH_CACHE_DIR", os.path.expanduser("~/.cache/trendspark/gsearch"))
+SEARCH_CACHE_TTL = 3600
+
+# Opened on first use → importing the module never touches the filesystem
+_CACHE: Optional[Cache] = None
+_CACHE_UNAVAILABLE = False
+_CACHE_LOCK = threading.Lock()
+
+# Cached values are zstd-compressed pickles (snippets compress ~3-5x).
+# zstd (de)compressor objects aren't thread-safe → one pair per thread.
+_zstd = threading.local()
+
+# Raised by _unpack for corrupt / truncated blobs or pickles of classes that have since changed
+_UNREADABLE_ENTRY_ERRORS = (
+    zstandard.ZstdError,
+    pickle.UnpicklingError,
+    EOFError,
+    AttributeError,
+    ImportError,
+    IndexError,
+    TypeError,
+    ValueError,
+)
+
+
+def _pack(competitors: List[Competitor]) -> bytes:
+    if not hasattr(_zstd, "compressor"):
+        _zstd.compressor = zstandard.ZstdCompressor(level=3)
+    return _zstd.compressor.compress(pickle.dumps(competitors, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _unpack(blob: bytes) -> List[Competitor]:
+    if not hasattr(_zstd, "decompressor"):
+        _zstd.decompressor = zstandard.ZstdDecompressor()
+    return pickle.loads(_zstd.decompressor.decompress(blob))
+
+
+def _get_cache() -> Optional[Cache]:
+    """Return the disk cache, opening it on first use (None if the directory isn't usable)."""
+    global _CACHE, _CACHE_UNAVAILABLE
+    with _CACHE_LOCK:
+        if _CACHE is None and not _CACHE_UNAVAILABLE:
+            try:
+                _CACHE = Cache(SEARCH_CACHE_DIR, size_limit=64 * 1024 * 1024)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Search cache disabled (%s): %s", SEARCH_CACHE_DIR, e)
+                _CACHE_UNAVAILABLE = True
+        return _CACHE
 
-    if not query.strip():
-        print("No valid keywords for competitor search")
-        return []
 
+# The cache is SQLite-backed (blocking, may wait on other workers' locks) → these
+# helpers run in a worker thread via asyncio.to_thread, like storage_service.
+
+def _read_cached(cache_key: tuple) -> Optional[List[Competitor]]:
+    cache = _get_cache()
+    if cache is None:
+        return None
+    blob = cache.get(cache_key)
+    if isinstance(blob, bytes):          # anything else is a stale pre-compression entry
+        try:
+            return _unpack(blob)
+        except _UNREADABLE_ENTRY_ERRORS:
+            logger.warning("Discarding unreadable cache entry for keyword: %.80s", cache_key[0])
+            cache.delete(cache_key)
+    return None
+
+
+def _write_cached(cache_key: tuple, competitors: List[Competitor]) -> None:
+    cache = _get_cache()
+    if cache is not None:
+        cache.set(cache_key, _pack(competitors), expire=SEARCH_CACHE_TTL)
+
+
+# Shared client → keeps one pooled HTTP/2 connection to googleapis.com alive across requests
+_CLIENT: Optional[httpx.AsyncClient] = None
+
+# Caps concurrent Google requests (per-key QPS allows ~10 in flight).
+# Created with the client → both belong to the event loop that is running them.
+_SEARCH_SEMAPHORE: Optional[asyncio.Semaphore] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use inside the running event loop."""
+    global _CLIENT, _SEARCH_SEMAPHORE
+    if _CLIENT is None:
+        _SEARCH_SEMAPHORE = asyncio.Semaphore(8)
+        _CLIENT = httpx.AsyncClient(
+            headers=_HEADERS,
+            timeout=12.0,                     # prevent hanging forever
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=3,                    # retry failed connection attempts (5xx: see _search_one)
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+            ),
+        )
+    return _CLIENT
+
+
+async def close_client() -> None:
+    """Close the shared HTTP client (called on app shutdown)."""
+    global _CLIENT, _SEARCH_SEMAPHORE
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+        _SEARCH_SEMAPHORE = None
+
+
+# Transient server errors → retried once by _search_one after a short pause
+_RETRYABLE_STATUSES = {500, 502, 503, 504}
+_SERVER_ERROR_RETRY_DELAY = 0.5
+
+
+def _retry_after_seconds(response: httpx.Response) -> float:
+    """Delay requested by a 429 response's Retry-After header (capped at 5s, 1s if missing/unparseable)."""
+    try:
+        return min(max(float(response.headers.get("Retry-After", "1")), 0.0), 5.0)
+    except ValueError:
+        return 1.0
+
+
+async def _search_one(query: str, max_results: int, _retries: int = 1) -> List[Competitor]:
+    """
+    Run a single Custom Search query and parse the results.
+    A 429 is retried once after Retry-After, a 500/502/503/504 once after a short pause.
+    """
     params = {
-        "key": SEARCH_API_KEY,
-        "cx": SEARCH_CX,
+        **_BASE_PARAMS,
         "q": query,
-        "num": min(max_results, 10),  # Google API max is 10 per request
-    }
-
-    headers = {
-        "User-Agent": "TrendSpark/1.0 (College Project; +https://github.com/your-repo)"
+        "num": min(max(max_results, 1), 10),  # Google API allows 1–10 per request
     }
 
     try:
-        response = requests.get(
-            SEARCH_URL,
-            params=params,
-            headers=headers,
-            timeout=12,              # prevent hanging forever
-        )
+        client = _get_client()
+        async with _SEARCH_SEMAPHORE:
+            response = await client.get(SEARCH_URL, params=params)
         response.raise_for_status()
 
-        data = response.json()
-
-        competitors: List[Competitor] = []
+        data = orjson.loads(response.content)
 
-        items = data.get("items", [])
-        for item in items[:max_results]:
-            snippet = item.get("snippet", "No description available")
-            # Clean up snippet (remove extra spaces/newlines)
-            snippet = " ".join(snippet.split())
-
-            competitors.append(
-                Competitor(
-                    name=item.get("title", "Untitled Result"),
-                    url=item.get("link", "#"),
-                    snippet=snippet,
-                )
+        competitors: List[Competitor] = [
+            Competitor(
+                name=item.get("title", "Untitled Result"),
+                url=item.get("link", "#"),
+                # Clean up snippet (remove extra spaces/newlines)
+                snippet=_WS_RE.sub(" ", item.get("snippet", "No description available")).strip(),
             )
+            for item in data.get("items", [])    # API already returns at most `num` items
+        ]
 
-        print(f"Found {len(competitors)} potential competitors for query: {query[:80]}...")
+        logger.info("Found %d potential competitors for query: %.80s", len(competitors), query)
         return competitors
 
-    except requests.exceptions.HTTPError as e:
-        status = e.response.status_code if e.response else "unknown"
-        print(f"Google Search API HTTP error {status}: {e}")
+    except httpx.HTTPStatusError as e:
+        status = e.response.status_code
+        # Not the exception itself → its message contains the request URL, API key included
+        logger.warning("Google Search API HTTP error %s: %s", status, e.response.reason_phrase)
         if status == 429:
-            print("→ Rate limit exceeded. Consider waiting or upgrading quota.")
+            if _retries > 0:
+                delay = _retry_after_seconds(e.response)
+                logger.warning("→ Rate limited. Retrying in %.1fs...", delay)
+                await asyncio.sleep(delay)
+                return await _search_one(query, max_results, _retries - 1)
+            logger.warning("→ Rate limit exceeded. Consider waiting or upgrading quota.")
+        elif status in _RETRYABLE_STATUSES:
+            if _retries > 0:
+                logger.warning("→ Server error. Retrying in %.1fs...", _SERVER_ERROR_RETRY_DELAY)
+                await asyncio.sleep(_SERVER_ERROR_RETRY_DELAY)
+                return await _search_one(query, max_results, _retries - 1)
         elif status == 403:
-            print("→ API key or CX invalid / quota exceeded.")
+            logger.warning("→ API key or CX invalid / quota exceeded.")
+        return []
+
+    except httpx.RequestError as e:
+        logger.warning("Network/search error during competitor lookup: %s", e)
+        return []
+
+    except (ValueError, orjson.JSONDecodeError) as e:
+        logger.warning("JSON decode error from Google API: %s", e)
         return []
 
-    except requests.exceptions.RequestException as e:
-        print(f"Network/search error during competitor lookup: {e}")
+
+async def _search_keyword(keyword: str, max_results: int) -> List[Competitor]:
+    """Search a single normalized keyword, served from the disk cache when possible."""
+    cache_key = (keyword, max_results)
+    cached = await asyncio.to_thread(_read_cached, cache_key)
+    if cached is not None:
+        return cached
+
+    competitors = await _search_one(f'"{keyword}"', max_results)
+
+    # Empty usually means the search failed → try again next time
+    if competitors:
+        await asyncio.to_thread(_write_cached, cache_key, competitors)
+
+    return competitors
+
+
+async def get_competitor_search(keywords: List[str], k: int = 3, max_results: int = 3) -> List[Competitor]:
+    """
+    Search for potential competitors using Google Custom Search JSON API.
+    Each of the top k keywords is searched concurrently and the results are merged.
+
+    Args:
+        keywords: List of potential search keywords from market analysis
+        k: Number of top keywords to search (default 3)
+        max_results: Max number of results per keyword (default 3)
+
+    Returns:
+        List of Competitor objects (name, url, snippet), deduplicated by URL
+    """
+    if not keywords or not SEARCH_API_KEY or not SEARCH_CX:
+        logger.info("Skipping competitor search: no keywords or missing API credentials")
         return []
 
-    except ValueError as e:
-        print(f"JSON decode error from Google API: {e}")
+    # Normalized (stripped, lower-cased) and deduplicated in order before picking
+    # the first k, then sorted → permuted or overlapping keyword lists map onto
+    # the same per-keyword cache entries
+    normalized = dict.fromkeys(kw for kw in (raw.strip().lower() for raw in keywords) if kw)
+    top_keywords = sorted(list(normalized)[:k])
+
+    if not top_keywords:
+        logger.info("No valid keywords for competitor search")
         return []
 
-    except Exception as e:
-        print(f"Unexpected error in get_competitor_search: {e}")
-        return []
\ No newline at end of file
+    # One query per keyword → same wall-clock time as a single search, more coverage.
+    # Expected API/network errors come back as []; anything else is logged here per keyword.
+    results = await asyncio.gather(
+        *(_search_keyword(kw, max_results) for kw in top_keywords),
+        return_exceptions=True,
+    )
+
+    competitors: List[Competitor] = []
+    seen_urls = set()
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.error("Competitor search failed for one keyword", exc_info=result)
+            continue
+        for competitor in result:
+            if competitor.url not in seen_urls:
+                seen_urls.add(competitor.url)
+                competitors.append(competitor)
+
+    return competitors
+
+
+async def get_competitor_searches_batch(
+    keyword_groups: List[List[str]],
+    max_results: int = 6
+) -> List[List[Competitor]]:
+    """
+    Run get_competitor_search for several keyword groups (e.g. market segments) concurrently.
+
+    Returns:
+        One list of Competitor objects per group, in order ([] if that group's search failed)
+    """
+    results = await asyncio.gather(
+        *(get_competitor_search(group, max_results=max_results) for group in keyword_groups),
+        return_exceptions=True,
+    )
+
+    batch: List[List[Competitor]] = []
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.error("Competitor search failed for one keyword group", exc_info=result)
+            batch.append([])
+        else:
+            batch.append(result)
+    return batch
+
+
+def get_competitor_search_sync(keywords: List[str], k: int = 3, max_results: int = 3) -> List[Competitor]:
+    """Blocking wrapper around get_competitor_search for callers outside an event loop (scripts, REPL)."""
+    async def _run() -> List[Competitor]:
+        try:
+            return await get_competitor_search(keywords, k, max_results)
+        finally:
+            # The pooled connections belong to this temporary loop → don't leak them
+            await close_client()
+
+    return asyncio.run(_run())
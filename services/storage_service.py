@@ -0,0 +1,31 @@
+# services/storage_service.py
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+from models import ValidationReport
+
+logger = logging.getLogger("trendspark")
+
+# Finished reports are saved here as <report_id>.json
+REPORTS_DIR = Path(os.getenv("REPORTS_DIR", "reports"))
+
+
+def _write_report(report: ValidationReport) -> None:
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = REPORTS_DIR / f"{report.report_id}.json"
+    path.write_text(report.model_dump_json(indent=2), encoding="utf-8")
+
+
+async def persist_report(report: ValidationReport) -> None:
+    """
+    Save a report to disk.
+    Meant to run as a background task after the response is sent;
+    the blocking file write happens in a worker thread.
+    """
+    try:
+        await asyncio.to_thread(_write_report, report)
+        logger.info("Saved report %s", report.report_id)
+    except OSError as e:
+        logger.error("Could not save report %s: %s", report.report_id, e)